@@ -8,8 +8,10 @@ for extracurricular activities at Mergington High School.
 from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse
+from pydantic import BaseModel, Field
 import os
 from pathlib import Path
+from threading import Lock
 
 app = FastAPI(title="Mergington High School API",
               description="API for viewing and signing up for extracurricular activities")
@@ -80,6 +82,14 @@ activities = {
     }
 }
 
+# Guards participant lists; sync endpoints run concurrently in a threadpool
+activities_lock = Lock()
+
+
+class BatchSignupRequest(BaseModel):
+    email: str
+    activities: list[str] = Field(min_length=1)
+
 
 @app.get("/")
 def root():
@@ -101,15 +111,37 @@ def signup_for_activity(activity_name: str, email: str):
     # Get the specific activity
     activity = activities[activity_name]
 
-    # Validate student is not already signed up
-    if email in activity["participants"]:
-        raise HTTPException(status_code=400, detail="Student is already signed up for this activity")
+    with activities_lock:
+        # Validate student is not already signed up
+        if email in activity["participants"]:
+            raise HTTPException(status_code=400, detail="Student is already signed up for this activity")
 
-    # Add student
-    activity["participants"].append(email)
+        # Add student
+        activity["participants"].append(email)
     return {"message": f"Signed up {email} for {activity_name}"}
 
 
+@app.post("/activities/batch_signup")
+def batch_signup_for_activities(signup: BatchSignupRequest):
+    """Sign up a student for several activities at once"""
+    # Ignore repeated names while keeping the requested order
+    activity_names = list(dict.fromkeys(signup.activities))
+
+    with activities_lock:
+        # Validate every activity before changing anything
+        for activity_name in activity_names:
+            if activity_name not in activities:
+                raise HTTPException(status_code=404, detail=f"Activity not found: {activity_name}")
+            if signup.email in activities[activity_name]["participants"]:
+                raise HTTPException(status_code=400,
+                                    detail=f"Student is already signed up for {activity_name}")
+
+        # Add student to all activities
+        for activity_name in activity_names:
+            activities[activity_name]["participants"].append(signup.email)
+    return {"message": f"Signed up {signup.email} for {', '.join(activity_names)}"}
+
+
 @app.delete("/activities/{activity_name}/unregister")
 def unregister_from_activity(activity_name: str, email: str):
     """Unregister a student from an activity"""
@@ -120,10 +152,11 @@ def unregister_from_activity(activity_name: str, email: str):
     # Get the specific activity
     activity = activities[activity_name]
 
-    # Validate student is signed up
-    if email not in activity["participants"]:
-        raise HTTPException(status_code=400, detail="Student is not signed up for this activity")
+    with activities_lock:
+        # Validate student is signed up
+        if email not in activity["participants"]:
+            raise HTTPException(status_code=400, detail="Student is not signed up for this activity")
 
-    # Remove student
-    activity["participants"].remove(email)
+        # Remove student
+        activity["participants"].remove(email)
     return {"message": f"Unregistered {email} from {activity_name}"}